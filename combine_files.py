@@ -2,16 +2,65 @@ import os
 import sys
 import subprocess
 import argparse
+import atexit
+import bisect
+import functools
+import contextlib
+import collections
+import itertools
+import concurrent.futures
+import io
+import mmap
+import re
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
 
 PathLike = Union[str, Path]
-GitCommandResult = Tuple[bool, Union[str, List[str]]]
+GitCommandResult = Tuple[bool, Union[str, bytes, List[str]]]
 ProcessingResult = Tuple[bool, str]
+FileBody = Union[bytes, mmap.mmap]
+
+
+def _env_int(name: str, default: int) -> int:
+    """
+    Read a non-negative integer setting from the environment.
+
+    Args:
+        name: Environment variable name
+        default: Value used when the variable is unset or not a number
+
+    Returns:
+        The parsed value or default
+    """
+    value = os.environ.get(name, '').strip()
+    return int(value) if value.isdecimal() else default
+
 
 CONFIG = {
     'max_recursion_depth': 3,
     'encoding': 'utf-8',
+    # Reads block on I/O, so use more threads than cores; the read-ahead
+    # window also bounds how many files (and descriptors) are held open
+    'read_workers': min(32, (os.cpu_count() or 1) * 4),
+    'read_ahead': 2 * min(32, (os.cpu_count() or 1) * 4),
+    # Below this many files a thread pool costs more than it saves;
+    # override with the COMBINE_FILES_BATCH_THRESHOLD environment variable
+    'batch_threshold': _env_int('COMBINE_FILES_BATCH_THRESHOLD', 8),
+    'read_buffer_size': 128 * 1024,
+    'output_buffer_size': 1024 * 1024,
+    'mmap_threshold': 64 * 1024,
+    'max_file_size': 2 * 1024 * 1024,
+    'binary_extensions': frozenset({
+        '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp', '.pdf',
+        '.zip', '.gz', '.tar', '.bz2', '.xz', '.7z', '.jar', '.whl',
+        '.so', '.dll', '.dylib', '.exe', '.o', '.a', '.pyc', '.class',
+        '.woff', '.woff2', '.ttf', '.otf', '.mp3', '.mp4', '.wav', '.mov',
+    }),
     'file_begin_marker': '// BEGIN FILE: {}',
     'file_end_marker': '// END FILE',
     'dir_marker': '(DIR)'
@@ -26,9 +75,27 @@ MESSAGES = {
     'empty_input': 'Please enter some numbers or press Ctrl+C to exit.',
     'invalid_number': 'Invalid number: {}',
     'operation_cancelled': f"{os.linesep}Operation cancelled.",
+    'file_not_found': 'File not found: {}',
+    'binary_file_skipped': '[Skipped binary file]',
+    'large_file_skipped': '[Skipped file larger than {} bytes]',
     'file_read_error': 'Error reading file: {}'
 }
 
+_BACKSLASH_TO_SLASH = str.maketrans('\\', '/')
+_SEPARATORS_TO_SPACE = str.maketrans(',;', '  ')
+# A selection made only of numbers and separators, and the numbers in it
+_SELECTION_RE = re.compile(r'[\d\s,;]+')
+_NUMBER_RE = re.compile(r'\d+')
+# O_BINARY only exists (and matters) on Windows
+_READ_FLAGS = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+
+# Git root per working directory, filled in by get_git_root()
+_GIT_ROOT_CACHE: Dict[str, Optional[Path]] = {}
+
+# Shared `git cat-file --batch` readers per Git root, see get_cat_file()
+_CAT_FILE_CACHE: Dict[Path, 'GitCatFile'] = {}
+
+
 def normalize_git_path(path: PathLike) -> str:
     """
     Normalize a path to use forward slashes for Git compatibility.
@@ -39,38 +106,62 @@ def normalize_git_path(path: PathLike) -> str:
     Returns:
         Normalized path string using forward slashes
     """
-    return str(path).replace('\\', '/')
+    path_str = str(path)
+    if '\\' not in path_str:
+        return path_str
+    return path_str.translate(_BACKSLASH_TO_SLASH)
 
 
-def run_git_command(args: List[str], cwd: Optional[Path] = None) -> GitCommandResult:
+def run_git_command(args: List[str], cwd: Optional[PathLike] = None, binary: bool = False) -> GitCommandResult:
     """
     Run a Git command and return the result.
 
     Args:
         args: List of command arguments
         cwd: Working directory for command execution
+        binary: Return the raw, unstripped output bytes instead of text
 
     Returns:
-        Tuple of (success, result) where result is either output string or error message
+        Tuple of (success, result) where result is either output or error message
     """
     try:
-        output = subprocess.check_output(['git'] + args, cwd=cwd, universal_newlines=True)
-        return True, output.strip()
+        result = subprocess.run(
+            ['git', *args],
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
     except subprocess.CalledProcessError:
         return False, MESSAGES['not_git_repo']
 
+    if binary:
+        return True, result.stdout
+    return True, result.stdout.decode(CONFIG['encoding'], errors='surrogateescape').strip()
+
 
-def get_git_root() -> Optional[Path]:
+def get_git_root(cwd: Optional[PathLike] = None) -> Optional[Path]:
     """
-    Get the root directory of the current Git repository.
+    Get the root directory of the Git repository containing a directory.
+
+    The lookup is cached per directory, so repeated calls within one
+    run spawn `git rev-parse` only once. Use clear_caches() to reset it.
+
+    Args:
+        cwd: Directory to look up, the current working directory if not given
 
     Returns:
         Path to Git root directory or None if not in a repository
     """
-    success, result = run_git_command(['rev-parse', '--show-toplevel'])
-    if success:
-        return Path(result)
-    return None
+    key = os.path.abspath(cwd) if cwd is not None else os.getcwd()
+    if key in _GIT_ROOT_CACHE:
+        return _GIT_ROOT_CACHE[key]
+
+    success, result = run_git_command(['rev-parse', '--show-toplevel'], key)
+    git_root = Path(result) if success else None
+    _GIT_ROOT_CACHE[key] = git_root
+    return git_root
 
 
 def remove_path_prefix(path: str, prefix: str) -> str:
@@ -87,6 +178,36 @@ def remove_path_prefix(path: str, prefix: str) -> str:
     return path[len(prefix):] if prefix else path
 
 
+def _is_outside(relative_path: str) -> bool:
+    """Check whether a relative path produced by os.path.relpath leaves its start."""
+    return relative_path.split(os.sep, 1)[0] == os.pardir
+
+
+def relative_to_root(path: PathLike, git_root: PathLike) -> str:
+    """
+    Express a path relative to the Git root, using forward slashes.
+
+    Uses plain absolute-path normalization and only falls back to
+    resolving symlinks when the cheap comparison fails.
+
+    Args:
+        path: Path to convert
+        git_root: Git repository root directory
+
+    Returns:
+        The path relative to git_root
+
+    Raises:
+        ValueError: If the path is not inside git_root
+    """
+    relative_path = os.path.relpath(os.path.abspath(path), os.path.abspath(git_root))
+    if _is_outside(relative_path):
+        relative_path = os.path.relpath(os.path.realpath(path), os.path.realpath(git_root))
+        if _is_outside(relative_path):
+            raise ValueError(f"{path} is not inside {git_root}")
+    return normalize_git_path(relative_path)
+
+
 def try_parse_number(input: str, min_value: int, max_value: int) -> Tuple[bool, int]:
     """
     Try parsing a number in the range [min_value, max_value].
@@ -101,62 +222,175 @@ def try_parse_number(input: str, min_value: int, max_value: int) -> Tuple[bool,
         - success is True if the operation was successful, False otherwise.
         - result is the parsed number.
     """
-    try:
+    # Plain digits need no exception handling; anything else still goes
+    # through int(), which also accepts forms like "+3" or "1_0"
+    if input.isdecimal():
         num = int(input)
-        if num >= min_value and num <= max_value:
-            return True, num
-        return False, 0
-    except ValueError:
-        return False, 0
+    else:
+        try:
+            num = int(input)
+        except ValueError:
+            return False, 0
+
+    if num >= min_value and num <= max_value:
+        return True, num
+    return False, 0
+
+
+def _list_index_with_pygit2(git_root: Path) -> Optional[Tuple[str, ...]]:
+    """
+    List the paths in the Git index with pygit2.
+
+    Args:
+        git_root: Git repository root directory
+
+    Returns:
+        Tuple of tracked paths in index order, or None if pygit2 cannot
+        read the repository and git should be used instead
+    """
+    try:
+        index = pygit2.Repository(os.fspath(git_root)).index
+        return tuple(entry.path for entry in index)
+    except (pygit2.GitError, KeyError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _list_all_tracked_files(git_root: Path) -> Tuple[bool, Union[str, Tuple[str, ...]]]:
+    """
+    Run `git ls-files` once for the whole repository and cache the output.
+
+    Later lookups filter the cached listing in Python instead of
+    spawning another `git ls-files` per directory. If pygit2 is
+    installed, the index is read in-process without any subprocess.
+    The listing is kept sorted so directory contents can be found
+    with a binary search, see _paths_under().
+
+    Args:
+        git_root: Git repository root directory
+
+    Returns:
+        Tuple of (success, result) where result is a sorted tuple of paths or error message
+    """
+    if pygit2 is not None:
+        tracked_paths = _list_index_with_pygit2(git_root)
+        if tracked_paths is not None:
+            return True, tuple(sorted(tracked_paths))
+
+    success, output = run_git_command(['ls-files', '-z', '--cached', '--full-name'], git_root, binary=True)
+    if not success:
+        return False, output
+
+    # NUL-separated output is never quoted, so unusual names come through
+    # verbatim, and git always separates components with forward slashes.
+    # Bytes that are not valid UTF-8 are kept via surrogateescape, which is
+    # how os.fsdecode() spells them too, so the files can still be opened.
+    # Git already sorts the index, so this sort is a cheap linear pass.
+    return True, tuple(sorted(output.decode(CONFIG['encoding'], errors='surrogateescape').split("\0")[:-1]))
+
+
+def clear_caches() -> None:
+    """
+    Forget cached Git roots and file listings, e.g. after the index changes.
+
+    Shared cat-file processes are closed too, since a running
+    `git cat-file --batch` keeps answering from the index it started with.
+    """
+    _GIT_ROOT_CACHE.clear()
+    _list_all_tracked_files.cache_clear()
+    close_cat_files()
 
 
-def get_tracked_paths(directory: Path, recursive: bool = False) -> GitCommandResult:
+def _paths_under(tracked_paths: Sequence[str], git_prefix: str) -> Sequence[str]:
+    """
+    Get the slice of a sorted listing that starts with a directory prefix.
+
+    Args:
+        tracked_paths: Sorted paths relative to the Git root
+        git_prefix: Directory prefix ending in a slash, or empty for all paths
+
+    Returns:
+        The matching paths, found by binary search instead of a full scan
+    """
+    if not git_prefix:
+        return tracked_paths
+
+    # Every path starting with "dir/" sorts before "dir0", as "0" follows "/"
+    start = bisect.bisect_left(tracked_paths, git_prefix)
+    end = bisect.bisect_left(tracked_paths, git_prefix[:-1] + chr(ord('/') + 1), start)
+    return tracked_paths[start:end]
+
+
+def _git_prefix(directory: PathLike, git_root: PathLike) -> str:
+    """
+    Get the prefix that tracked paths inside a directory start with.
+
+    Args:
+        directory: Directory inside the repository
+        git_root: Git repository root directory
+
+    Returns:
+        The directory relative to git_root with a trailing slash, or an
+        empty string for the root itself
+
+    Raises:
+        ValueError: If the directory is not inside git_root
+    """
+    relative_path = relative_to_root(directory, git_root)
+    return f"{relative_path}/" if relative_path != "." else ""
+
+
+def _iter_filtered_paths(tracked_paths: Sequence[str], git_prefix: str, recursive: bool) -> Iterator[str]:
+    """
+    Yield the tracked paths under a prefix in a single pass.
+
+    Args:
+        tracked_paths: Sorted paths relative to the Git root
+        git_prefix: Prefix of the directory being listed
+        recursive: Yield full paths instead of top-level names
+
+    Yields:
+        Full paths, or top-level names relative to the prefix (possibly repeated)
+    """
+    for path in _paths_under(tracked_paths, git_prefix):
+        if recursive:
+            yield path
+            continue
+
+        # git paths always use forward slashes, so a plain split is enough
+        yield remove_path_prefix(path, git_prefix).partition('/')[0]
+
+
+def get_tracked_paths(directory: Path, recursive: bool = False, git_root: Optional[Path] = None) -> GitCommandResult:
     """
     Get list of Git-tracked paths in specified directory.
 
     Args:
         directory: Target directory to scan
         recursive: Whether to include files in subdirectories
+        git_root: Git repository root directory, looked up from directory if not given
 
     Returns:
         Tuple of (success, result) where result is list of paths or error message
     """
-    git_root = get_git_root()
+    if git_root is None:
+        if not os.path.isdir(directory):
+            return False, MESSAGES['dir_not_exist'].format(directory)
+        git_root = get_git_root(directory)
     if not git_root:
         return False, MESSAGES['not_git_repo']
 
     try:
-        abs_directory = directory.resolve()
-        rel_directory = abs_directory.relative_to(git_root)
-        git_prefix = normalize_git_path(rel_directory)
-        git_prefix = f"{git_prefix}/" if git_prefix != "." else ""
+        git_prefix = _git_prefix(directory, git_root)
     except ValueError:
         return False, MESSAGES['dir_not_exist'].format(directory)
 
-    success, output = run_git_command(['ls-files', '--full-name'], git_root)
+    success, tracked_paths = _list_all_tracked_files(git_root)
     if not success:
-        return False, output
-
-    if not output:
-        return True, []
-
-    tracked_paths = [normalize_git_path(p) for p in output.split("\n")]
-    filtered_paths = []
-
-    for path in tracked_paths:
-        if git_prefix and not path.startswith(git_prefix):
-            continue
-
-        relative_path = remove_path_prefix(path, git_prefix)
-        if recursive:
-            filtered_paths.append(path)
-            continue
-
-        top_level = Path(relative_path).parts[0]
-        filtered_paths.append(normalize_git_path(top_level))
+        return False, tracked_paths
 
     # Remove duplicates while preserving order
-    unique_paths = list(dict.fromkeys(filtered_paths))
+    unique_paths = list(dict.fromkeys(_iter_filtered_paths(tracked_paths, git_prefix, recursive)))
     return True, unique_paths
 
 
@@ -164,6 +398,9 @@ def read_file_content(file_path: Path, git_root: Path) -> ProcessingResult:
     """
     Read content from a file with error handling.
 
+    Part of the public API; the command line tool itself streams file
+    bodies through write_file_contents() instead.
+
     Args:
         file_path: Path to file relative to git root
         git_root: Git repository root directory
@@ -171,35 +408,92 @@ def read_file_content(file_path: Path, git_root: Path) -> ProcessingResult:
     Returns:
         Tuple of (success, content) where content is file content or error message
     """
-    full_path = git_root.joinpath(file_path)
-    if not full_path.is_file():
-        return False, f"File not found: {file_path}"
-
     try:
-        with open(full_path, "r", encoding=CONFIG['encoding']) as file:
+        with open(git_root.joinpath(file_path), "r", encoding=CONFIG['encoding']) as file:
             file_content = file.read()
             return True, file_content
+    except (FileNotFoundError, IsADirectoryError):
+        return False, MESSAGES['file_not_found'].format(file_path)
+    except PermissionError as e:
+        # The file exists, so report why it could not be read
+        return False, MESSAGES['file_read_error'].format(str(e))
     except Exception as e:
         return False, MESSAGES['file_read_error'].format(str(e))
 
 
-def partition_by_file_type(paths: List[str], base_dir: Path) -> Tuple[List[str], List[str]]:
+def _tracked_children(directory: Path, git_root: Path) -> Optional[Tuple[Set[str], Set[str]]]:
+    """
+    Classify the tracked direct children of a directory from the cached listing.
+
+    A child is a directory if some tracked path continues past it with
+    another component, so no filesystem access is needed.
+
+    Args:
+        directory: Directory whose children to classify
+        git_root: Git repository root directory
+
+    Returns:
+        Tuple of (directory names, file names), or None if the listing
+        is not available for the directory
+    """
+    success, tracked_paths = _list_all_tracked_files(git_root)
+    if not success:
+        return None
+
+    try:
+        git_prefix = _git_prefix(directory, git_root)
+    except ValueError:
+        return None
+
+    dir_names = set()
+    file_names = set()
+    prefix_len = len(git_prefix)
+    for path in _paths_under(tracked_paths, git_prefix):
+        top_level, sep, _ = path[prefix_len:].partition('/')
+        (dir_names if sep else file_names).add(top_level)
+
+    return dir_names, file_names
+
+
+def partition_by_file_type(paths: List[str], base_dir: Path, git_root: Optional[Path] = None) -> Tuple[List[str], List[str]]:
     """
     Separate paths into directories and files.
 
+    When git_root is given, direct children of base_dir are classified from
+    the cached git ls-files listing without touching the filesystem.
+    Otherwise they are classified from a single directory scan, whose
+    entries carry their file type without extra stat calls. Any remaining
+    paths fall back to os.path.isdir().
+
     Args:
         paths: List of paths to partition
         base_dir: Base directory for resolving paths
+        git_root: Git repository root directory, if known
 
     Returns:
         Tuple of (directories, files) lists
     """
     directories = []
     files = []
+    base = os.fspath(base_dir)
+
+    children = _tracked_children(base_dir, git_root) if git_root else None
+    if children is not None:
+        dir_names, file_names = children
+    else:
+        file_names = set()
+        try:
+            with os.scandir(base) as entries:
+                dir_names = {entry.name for entry in entries if entry.is_dir()}
+        except OSError:
+            dir_names = set()
 
     for path in paths:
-        full_path = base_dir.joinpath(path)
-        if full_path.is_dir():
+        if path in dir_names:
+            directories.append(path)
+        elif path in file_names or ('/' not in path and children is None):
+            files.append(path)
+        elif os.path.isdir(os.path.join(base, path)):
             directories.append(path)
         else:
             files.append(path)
@@ -220,48 +514,336 @@ def collect_all_files(selected_paths: List[str], target_dir: Path, git_root: Pat
         List of all file paths to process
     """
     all_files = []
+    dir_prefixes = []
+    # Make both ends absolute once so the loop never calls getcwd(), and
+    # resolve symlinks up front if the target is only inside the root
+    # through one, so the per-item comparison never has to fall back to it
+    target = os.path.abspath(target_dir)
+    root = os.path.abspath(git_root)
+    if _is_outside(os.path.relpath(target, root)):
+        target = os.path.realpath(target)
+        root = os.path.realpath(root)
 
     for path in selected_paths:
-        full_path = Path(target_dir).joinpath(path)
+        full_path = os.path.join(target, path)
+        relative_path = relative_to_root(full_path, root)
 
-        if not full_path.is_dir():
-            relative_path = full_path.resolve().relative_to(git_root.resolve())
-            all_files.append(normalize_git_path(relative_path))
+        if not os.path.isdir(full_path):
+            all_files.append(relative_path)
             continue
 
-        # Recurse into directories
-        success, files = get_tracked_paths(full_path, recursive=True)
-        if not success or not isinstance(files, list):
-            continue
+        dir_prefixes.append(f"{relative_path}/" if relative_path != "." else "")
 
-        all_files.extend(files)
+    # Expand the selected directories from the cached listing
+    if dir_prefixes:
+        success, tracked_paths = _list_all_tracked_files(git_root)
+        if success:
+            for prefix in dir_prefixes:
+                all_files.extend(_paths_under(tracked_paths, prefix))
 
     return sorted(set(all_files))
 
 
-def format_file_contents(file_paths: List[str], git_root: Path) -> ProcessingResult:
+def is_binary_path(file_path: str) -> bool:
     """
-    Format contents of multiple files with markers.
+    Check whether a path has one of the configured binary file extensions.
 
     Args:
-        file_paths: List of files to process
+        file_path: Path to check
+
+    Returns:
+        True if the file should be treated as binary
+    """
+    return os.path.splitext(file_path)[1].lower() in CONFIG['binary_extensions']
+
+
+def _read_fd(fd: int, size: int) -> bytes:
+    """
+    Read a file descriptor to the end.
+
+    Args:
+        fd: Open file descriptor positioned at the start
+        size: Size reported by fstat, so most files take a single read
+
+    Returns:
+        All bytes read from fd
+    """
+    chunks = [os.read(fd, size + 1)]
+    while chunks[-1]:
+        chunks.append(os.read(fd, CONFIG['read_buffer_size']))
+    return b"".join(chunks)
+
+
+def read_file_body(file_path: str, git_root: Path) -> FileBody:
+    """
+    Load the raw bytes of a file for output.
+
+    Large files are memory-mapped so their pages are written straight
+    from the page cache; smaller ones are read in one call, where mmap
+    setup would cost more than it saves. Binary files and files above
+    the size limit are skipped, and unreadable files are replaced by an
+    error message.
+
+    Args:
+        file_path: Path to file relative to git root
         git_root: Git repository root directory
 
     Returns:
-        Tuple of (success, formatted_content)
+        The file body as bytes, or a read-only mmap the caller must close
+    """
+    encoding = CONFIG['encoding']
+    if is_binary_path(file_path):
+        return MESSAGES['binary_file_skipped'].encode(encoding)
+
+    try:
+        # Raw descriptors skip building a buffered file object per file
+        fd = os.open(os.path.join(git_root, file_path), _READ_FLAGS)
+        try:
+            size = os.fstat(fd).st_size
+            if size > CONFIG['max_file_size']:
+                return MESSAGES['large_file_skipped'].format(CONFIG['max_file_size']).encode(encoding)
+
+            if size >= CONFIG['mmap_threshold']:
+                return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+
+            return _read_fd(fd, size)
+        finally:
+            os.close(fd)
+    except (FileNotFoundError, IsADirectoryError):
+        return MESSAGES['file_not_found'].format(file_path).encode(encoding)
+    except OSError as e:
+        return MESSAGES['file_read_error'].format(str(e)).encode(encoding)
+
+
+class GitCatFile:
+    """
+    Read file contents from the Git index through one `git cat-file --batch` process.
+
+    The process is started once and every file is requested over its
+    stdin, so reading many files costs a single fork/exec. Use it as a
+    context manager so the process is reaped when done.
+    """
+
+    def __init__(self, git_root: Path) -> None:
+        self.git_root = git_root
+        self._process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> 'GitCatFile':
+        return self.open()
+
+    def open(self) -> 'GitCatFile':
+        """Start the git process if it is not already running."""
+        if self._process is None:
+            self._process = subprocess.Popen(
+                ['git', 'cat-file', '--batch'],
+                cwd=self.git_root,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the pipes and wait for the git process to exit."""
+        if self._process is None:
+            return
+
+        self._process.stdin.close()
+        self._process.stdout.close()
+        self._process.wait()
+        self._process = None
+
+    def read_body(self, file_path: str) -> FileBody:
+        """
+        Load the staged contents of a file for output.
+
+        Applies the same binary and size limits as read_file_body().
+
+        Args:
+            file_path: Path to file relative to git root
+
+        Returns:
+            The file body, or a placeholder or error message as bytes
+        """
+        encoding = CONFIG['encoding']
+        if is_binary_path(file_path):
+            return MESSAGES['binary_file_skipped'].encode(encoding)
+
+        # The batch protocol is line based, so such names cannot be requested
+        if '\n' in file_path:
+            return read_file_body(file_path, self.git_root)
+
+        stdin, stdout = self._process.stdin, self._process.stdout
+        stdin.write(f":{file_path}\n".encode(encoding, errors='surrogateescape'))
+        stdin.flush()
+
+        # Reply is "<object> <type> <size>" or "<request> missing"
+        header = stdout.readline()
+        if header.endswith(b" missing\n") or not header:
+            return MESSAGES['file_not_found'].format(file_path).encode(encoding)
+
+        size = int(header.rsplit(None, 1)[1])
+        if size > CONFIG['max_file_size']:
+            remaining = size + 1
+            while remaining:
+                remaining -= len(stdout.read(min(remaining, CONFIG['read_buffer_size'])))
+            return MESSAGES['large_file_skipped'].format(CONFIG['max_file_size']).encode(encoding)
+
+        body = stdout.read(size)
+        stdout.read(1)  # trailing newline after the contents
+        return body
+
+
+def get_cat_file(git_root: Path) -> GitCatFile:
+    """
+    Get the shared GitCatFile for a repository, starting it on first use.
+
+    All callers reading from the same repository reuse one process,
+    which is closed when the interpreter exits.
+
+    Args:
+        git_root: Git repository root directory
+
+    Returns:
+        An open GitCatFile for git_root
+    """
+    cat_file = _CAT_FILE_CACHE.get(git_root)
+    if cat_file is None:
+        cat_file = _CAT_FILE_CACHE[git_root] = GitCatFile(git_root)
+    return cat_file.open()
+
+
+@atexit.register
+def close_cat_files() -> None:
+    """Close every shared GitCatFile process."""
+    for cat_file in _CAT_FILE_CACHE.values():
+        cat_file.close()
+    _CAT_FILE_CACHE.clear()
+
+
+def _discard_pending(pending: Iterable[Tuple[str, "concurrent.futures.Future[FileBody]"]]) -> None:
+    """
+    Cancel or drain file reads that will not be written, closing their mmaps.
+
+    Args:
+        pending: Pairs of (file_path, future) from the read-ahead window
+    """
+    for _, future in pending:
+        if future.cancel() or future.exception() is not None:
+            continue
+        body = future.result()
+        if isinstance(body, mmap.mmap):
+            body.close()
+
+
+def _read_ahead(file_paths: List[str], load_body: Callable[[str], FileBody], workers: int, read_ahead: int) -> Iterator[Tuple[str, FileBody]]:
+    """
+    Load files on a thread pool, a bounded number of files ahead of the consumer.
+
+    Closing the generator early, e.g. after a failed write, releases the
+    bodies that were read ahead but not consumed.
+
+    Args:
+        file_paths: Files to load, in output order
+        load_body: Function loading one file body
+        workers: Number of reader threads
+        read_ahead: Number of files to keep loading ahead
+
+    Yields:
+        Pairs of (file_path, body) in the order of file_paths
     """
-    output_parts = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        submit = executor.submit
+        remaining = iter(file_paths)
+        pending = collections.deque(
+            (file_path, submit(load_body, file_path))
+            for file_path in itertools.islice(remaining, read_ahead)
+        )
+        popleft = pending.popleft
+        append = pending.append
 
-    for file_path in file_paths:
-        marker = CONFIG['file_begin_marker'].format(file_path)
-        output_parts.append(f"{os.linesep}{marker}")
+        try:
+            while pending:
+                file_path, future = popleft()
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    append((next_path, submit(load_body, next_path)))
+                yield file_path, future.result()
+        finally:
+            # Only non-empty if the consumer stopped early, e.g. on a broken pipe
+            _discard_pending(pending)
+
+
+def write_file_contents(file_paths: List[str], git_root: Path, out: BinaryIO, cat_file: Optional[GitCatFile] = None, jobs: Optional[int] = None) -> None:
+    """
+    Write contents of multiple files with markers directly to an output stream.
 
-        success, content = read_file_content(Path(file_path), git_root)
-        output_parts.append(content if success else content)
+    Files are loaded by a pool of reader threads a bounded number of files
+    ahead of the writer, so disk reads overlap with writing while the output
+    keeps the order of file_paths. When cat_file is given, contents come
+    from the Git index instead, loaded by a single reader thread since the
+    batch process answers one request at a time. Fewer files than
+    CONFIG['batch_threshold'] are read in the calling thread.
 
-        output_parts.append(f"{CONFIG['file_end_marker']}{os.linesep}{os.linesep}")
+    Args:
+        file_paths: List of files to process
+        git_root: Git repository root directory
+        out: Binary stream to write to
+        cat_file: Optional open GitCatFile to read staged contents from
+        jobs: Number of reader threads, based on the CPU count if not given
+    """
+    encoding = CONFIG['encoding']
+    # Split the marker template once instead of running str.format per file
+    begin_prefix, _, begin_suffix = CONFIG['file_begin_marker'].partition('{}')
+    begin_prefix = f"{os.linesep}{begin_prefix}"
+    begin_suffix = f"{begin_suffix}{os.linesep}"
+    end_block = f"{os.linesep}{CONFIG['file_end_marker']}{os.linesep}{os.linesep}".encode(encoding)
+
+    if cat_file is not None:
+        load_body = cat_file.read_body
+        workers = 1
+    else:
+        load_body = functools.partial(read_file_body, git_root=git_root)
+        workers = jobs or CONFIG['read_workers']
+    read_ahead = max(CONFIG['read_ahead'], workers)
+
+    if len(file_paths) < CONFIG['batch_threshold']:
+        bodies = ((file_path, load_body(file_path)) for file_path in file_paths)
+    else:
+        bodies = _read_ahead(file_paths, load_body, workers, read_ahead)
+
+    # Bind per-file lookups to locals once, the loop runs for every file
+    write = out.write
+    mmap_type = mmap.mmap
+
+    with contextlib.closing(bodies):
+        for file_path, body in bodies:
+            write((begin_prefix + file_path + begin_suffix).encode(encoding, errors='surrogateescape'))
+            try:
+                write(body)
+            finally:
+                if isinstance(body, mmap_type):
+                    body.close()
+            write(end_block)
 
-    return True, "\n".join(output_parts)
+
+def format_file_contents(file_paths: List[str], git_root: Path) -> ProcessingResult:
+    """
+    Format contents of multiple files with markers.
+
+    Args:
+        file_paths: List of files to process
+        git_root: Git repository root directory
+
+    Returns:
+        Tuple of (success, formatted_content)
+    """
+    buffer = io.BytesIO()
+    write_file_contents(file_paths, git_root, buffer)
+    return True, buffer.getvalue().decode(CONFIG['encoding'], errors='replace')
 
 
 def parse_selection(input_str: str, max_value: int) -> Tuple[bool, Union[List[int], str]]:
@@ -278,8 +860,15 @@ def parse_selection(input_str: str, max_value: int) -> Tuple[bool, Union[List[in
     if not input_str.strip():
         return False, MESSAGES['empty_input']
 
+    # Well-formed input is parsed in one pass; anything else falls through
+    # to the per-part loop, which names the first invalid part
+    if _SELECTION_RE.fullmatch(input_str):
+        indices = [int(number) - 1 for number in _NUMBER_RE.findall(input_str)]
+        if all(0 <= index < max_value for index in indices):
+            return True, indices
+
     indices = []
-    parts = input_str.replace(",", " ").replace(";", " ").split()
+    parts = input_str.translate(_SEPARATORS_TO_SPACE).split()
     for part in parts:
         success, number = try_parse_number(part, 1, max_value)
         if not success:
@@ -289,6 +878,44 @@ def parse_selection(input_str: str, max_value: int) -> Tuple[bool, Union[List[in
     return True, indices
 
 
+def format_item_listing(paths: List[str], directories: List[str]) -> str:
+    """
+    Format the numbered list of selectable items as a single string.
+
+    Args:
+        paths: Items in display order
+        directories: Items that should be marked as directories
+
+    Returns:
+        The listing with one numbered item per line
+    """
+    directory_set = set(directories)
+    dir_prefix = f"{CONFIG['dir_marker']} "
+    return os.linesep.join([
+        f"{idx}. {dir_prefix if path in directory_set else ''}{path}"
+        for idx, path in enumerate(paths, 1)
+    ])
+
+
+def positive_int(value: str) -> int:
+    """
+    Parse a command line value as a positive integer.
+
+    Args:
+        value: The raw argument value
+
+    Returns:
+        The parsed integer
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a positive integer
+    """
+    success, number = try_parse_number(value, 1, sys.maxsize)
+    if not success:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value}")
+    return number
+
+
 def create_arg_parser() -> argparse.ArgumentParser:
     """Create and configure the command line argument parser."""
     parser = argparse.ArgumentParser(
@@ -301,28 +928,67 @@ Examples:
   %(prog)s -p                         # Process all files in current directory
   %(prog)s -p /path/to/directory      # Process all files in specified directory
   %(prog)s -o output.txt              # Save output to file
+  %(prog)s -p --index                 # Output staged contents instead of working tree files
+  %(prog)s -p -j 4                    # Read files with 4 threads
         """
     )
     parser.add_argument('directory', nargs='?', default='.', help='Target directory (default: current directory)')
     parser.add_argument('-o', '--output', help='Output file path (default: print to stdout)')
     parser.add_argument('-p', '--path', action='store_true', help='Process entire directory without interactive selection')
+    parser.add_argument('--index', action='store_true', help='Read file contents from the Git index instead of the working tree')
+    parser.add_argument('-j', '--jobs', type=positive_int, help='Number of threads reading files (default: based on CPU count)')
     return parser
 
 
+@contextlib.contextmanager
+def open_output_stream(output_path: Optional[str] = None) -> Iterator[BinaryIO]:
+    """
+    Open a binary stream for the combined output.
+
+    Args:
+        output_path: Optional file path for output, stdout is used if not given
+
+    Yields:
+        Binary stream to write the output to
+    """
+    if output_path:
+        with open(output_path, 'wb', buffering=CONFIG['output_buffer_size']) as file:
+            yield file
+        return
+
+    sys.stdout.flush()
+    yield sys.stdout.buffer
+    sys.stdout.buffer.flush()
+
+
 def write_output(content: str, output_path: Optional[str] = None) -> None:
     """
     Output content to file or stdout.
 
+    The content is encoded once and written to the binary stream, which
+    bypasses the line-buffered text layer of stdout. Surrogate escapes
+    from undecodable file names are written back as the original bytes.
+
     Args:
         content: Content to output
         output_path: Optional file path for output
     """
-    if not output_path:
-        print(content)
-        return
+    with open_output_stream(output_path) as out:
+        out.write(content.encode(CONFIG['encoding'], errors='surrogateescape'))
+
+
+def write_combined_output(file_paths: List[str], git_root: Path, args: argparse.Namespace) -> None:
+    """
+    Write the combined contents of files to the configured output.
 
-    with open(output_path, 'w', encoding=CONFIG['encoding']) as file:
-        file.write(content)
+    Args:
+        file_paths: List of files to process
+        git_root: The root of the git repository.
+        args: The parsed command-line arguments.
+    """
+    cat_file = get_cat_file(git_root) if args.index else None
+    with open_output_stream(args.output) as out:
+        write_file_contents(file_paths, git_root, out, cat_file, args.jobs)
 
 
 def handle_non_interactive_mode(directories: List[str], files: List[str], target_dir: Path, git_root: Path, args: argparse.Namespace) -> None:
@@ -338,13 +1004,7 @@ def handle_non_interactive_mode(directories: List[str], files: List[str], target
     """
     sorted_paths = directories + files
     all_files = collect_all_files(sorted_paths, target_dir, git_root)
-    success, output = format_file_contents(all_files, git_root)
-    if success:
-        write_output(output, args.output)
-        return
-
-    print(output)
-    sys.exit(1)
+    write_combined_output(all_files, git_root, args)
 
 
 def handle_interactive_mode(directories: List[str], files: List[str], target_dir: Path, git_root: Path, args: argparse.Namespace) -> None:
@@ -360,9 +1020,9 @@ def handle_interactive_mode(directories: List[str], files: List[str], target_dir
     """
     sorted_paths = directories + files
     print(MESSAGES['tracked_items_header'])
-    for idx, path in enumerate(sorted_paths, 1):
-        prefix = f"{CONFIG['dir_marker']} " if path in directories else ""
-        print(f"{idx}. {prefix}{path}")
+    # Names that are not valid UTF-8 carry surrogate escapes, which a
+    # strict stdout would refuse, so write the listing as bytes
+    write_output(format_item_listing(sorted_paths, directories) + os.linesep)
 
     while True:
         try:
@@ -375,13 +1035,8 @@ def handle_interactive_mode(directories: List[str], files: List[str], target_dir
 
             selected_paths = [sorted_paths[i] for i in result]
             all_files = collect_all_files(selected_paths, target_dir, git_root)
-            success, output = format_file_contents(all_files, git_root)
-            if success:
-                write_output(output, args.output)
-                break
-
-            print(output)
-            sys.exit(1)
+            write_combined_output(all_files, git_root, args)
+            break
 
         except KeyboardInterrupt:
             print(MESSAGES['operation_cancelled'])
@@ -396,12 +1051,12 @@ def main() -> None:
         print(MESSAGES['dir_not_exist'].format(target_dir))
         sys.exit(1)
 
-    git_root = get_git_root()
+    git_root = get_git_root(target_dir)
     if not git_root:
         print(MESSAGES['not_git_repo'])
         sys.exit(1)
 
-    success, tracked_paths = get_tracked_paths(target_dir)
+    success, tracked_paths = get_tracked_paths(target_dir, git_root=git_root)
     if not success:
         print(tracked_paths)
         sys.exit(1)
@@ -410,7 +1065,7 @@ def main() -> None:
         print(MESSAGES['no_tracked_files'])
         sys.exit(0)
 
-    directories, files = partition_by_file_type(tracked_paths, git_root)
+    directories, files = partition_by_file_type(tracked_paths, target_dir, git_root)
     if args.path:
         handle_non_interactive_mode(directories, files, target_dir, git_root, args)
     else:
@@ -1,46 +1,101 @@
 import pytest
 import subprocess
+import io
 import os
+import re
+import shutil
+import sys
 from pathlib import Path
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 import combine_files
-from typing import Generator, Any, List
+from typing import Any, Dict, List, Tuple
 
 
-@pytest.fixture
-def git_repo(tmp_path: Path) -> Generator[Path, Any, None]:
-    """Create a temporary Git repository with test files."""
-    repo_path = tmp_path / "test_repo"
+TEST_FILES = {
+    "README.md": "# Test Project\nThis is a test project.",
+    "src/main.py": "def main():\n    print('Hello, World!')",
+    "src/utils.py": "def helper():\n    return True",
+    "tests/test_main.py": "def test_main():\n    assert True",
+}
+
+
+GIT = shutil.which("git") or "git"
+_SILENT = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+
+
+def git(repo_path: Path, *args: str, **kwargs: Any) -> subprocess.CompletedProcess:
+    """
+    Run a git command in a test repository.
+
+    An absolute executable, -C instead of cwd= and close_fds=False let
+    subprocess start git with posix_spawn instead of fork and exec.
+    Output is discarded unless the caller redirects it.
+    """
+    kwargs = {**_SILENT, **kwargs}
+    return subprocess.run([GIT, "-C", str(repo_path), *args], close_fds=False, check=True, **kwargs)
+
+
+def fast_import_stream(files: Dict[str, str], message: str = "Initial commit") -> bytes:
+    """Build a git fast-import stream committing files to the main branch."""
+    stream = bytearray()
+    for mark, content in enumerate(files.values(), 1):
+        data = content.encode()
+        stream += b"blob\nmark :%d\ndata %d\n%s\n" % (mark, len(data), data)
+
+    msg = message.encode()
+    stream += b"commit refs/heads/main\n"
+    stream += b"author Test User <test@example.com> 0 +0000\n"
+    stream += b"committer Test User <test@example.com> 0 +0000\n"
+    stream += b"data %d\n%s\n" % (len(msg), msg)
+    for mark, path in enumerate(files, 1):
+        stream += b"M 100644 :%d %s\n" % (mark, path.encode())
+    return bytes(stream)
+
+
+def parse_sections(output: str) -> Dict[str, str]:
+    """Split combined output into a mapping of file path to file body."""
+    nl = re.escape(os.linesep)
+    pattern = f"// BEGIN FILE: (.+?){nl}(.*?){nl}// END FILE"
+    return dict(re.findall(pattern, output, re.S))
+
+
+def assert_same_items(actual: List[str], expected: List[str]) -> None:
+    """Assert that actual holds exactly the expected items, in any order."""
+    assert len(actual) == len(set(actual)), "duplicate items"
+    assert set(actual) == set(expected)
+
+
+@pytest.fixture(scope="session")
+def git_repo_template(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """Create the test Git repository once per test session."""
+    repo_path = tmp_path_factory.mktemp("template") / "test_repo"
     repo_path.mkdir()
-    subprocess.run(["git", "init"], cwd=repo_path)
+    git(repo_path, "init", "-q", "-b", "main")
 
-    # Configure git
-    subprocess.run(["git", "config", "user.name", "Test User"], cwd=repo_path)
-    subprocess.run(["git", "config", "user.email", "test@example.com"], cwd=repo_path)
+    # Identity for commits made by the tests themselves
+    with open(repo_path / ".git" / "config", "a") as config:
+        config.write("[user]\n\tname = Test User\n\temail = test@example.com\n")
 
-    # Create test file structure
-    (repo_path / "src").mkdir()
-    (repo_path / "tests").mkdir()
+    # One process writes all objects and the commit, another checks them out
+    git(repo_path, "fast-import", "--quiet", input=fast_import_stream(TEST_FILES))
+    git(repo_path, "reset", "-q", "--hard")
+    return repo_path
 
-    files = {
-        "README.md": "# Test Project\nThis is a test project.",
-        "src/main.py": "def main():\n    print('Hello, World!')",
-        "src/utils.py": "def helper():\n    return True",
-        "tests/test_main.py": "def test_main():\n    assert True",
-    }
 
-    for file_path, content in files.items():
-        full_path = repo_path / file_path
-        full_path.parent.mkdir(exist_ok=True)
-        full_path.write_text(content)
-        subprocess.run(["git", "add", file_path], cwd=repo_path)
+@pytest.fixture(scope="session")
+def git_repo_ro(git_repo_template: Path, tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """Share one copy of the template repository between tests that do not modify it."""
+    repo_path = tmp_path_factory.mktemp("shared") / "test_repo"
+    shutil.copytree(git_repo_template, repo_path, symlinks=True)
+    return repo_path
 
-    subprocess.run(["git", "commit", "-m", "Initial commit"], cwd=repo_path)
 
-    original_dir = os.getcwd()
-    os.chdir(repo_path)
-    yield repo_path
-    os.chdir(original_dir)
+@pytest.fixture
+def git_repo(git_repo_template: Path, tmp_path: Path) -> Path:
+    """Give a test that modifies the repository its own copy of the template."""
+    repo_path = tmp_path / "test_repo"
+    shutil.copytree(git_repo_template, repo_path, symlinks=True)
+    return repo_path
 
 
 def test_normalize_git_path() -> None:
@@ -50,52 +105,93 @@ def test_normalize_git_path() -> None:
     assert combine_files.normalize_git_path(Path("path/to/file")) == "path/to/file"
 
 
-def test_run_git_command_success(git_repo: Path) -> None:
+def test_relative_to_root(tmp_path: Path) -> None:
+    """Test converting paths to be relative to the Git root."""
+    root = tmp_path / "root"
+    (root / "src").mkdir(parents=True)
+    link = tmp_path / "link"
+    link.symlink_to(root)
+
+    assert combine_files.relative_to_root(root / "src", root) == "src"
+    assert combine_files.relative_to_root(root / "src" / "..", root) == "."
+    assert combine_files.relative_to_root(link / "src", root) == "src"
+    assert combine_files.relative_to_root(str(root / "src" / "a.py"), str(root)) == "src/a.py"
+    with pytest.raises(ValueError):
+        combine_files.relative_to_root(tmp_path, root)
+
+
+def test_run_git_command_success(git_repo_ro: Path) -> None:
     """Test successful Git command execution."""
-    success, result = combine_files.run_git_command(["rev-parse", "--git-dir"])
+    success, result = combine_files.run_git_command(["rev-parse", "--git-dir"], git_repo_ro)
     assert success
     assert result == ".git"
 
 
+def test_run_git_command_binary(git_repo_ro: Path) -> None:
+    """Test returning raw Git command output."""
+    success, result = combine_files.run_git_command(["ls-files", "-z", "src"], git_repo_ro, binary=True)
+    assert success
+    assert result == b"src/main.py\0src/utils.py\0"
+
+
 def test_run_git_command_failure(tmp_path: Path) -> None:
     """Test Git command failure handling."""
-    os.chdir(tmp_path)
-    success, result = combine_files.run_git_command(["status"])
+    success, result = combine_files.run_git_command(["status"], tmp_path)
     assert not success
     assert result == combine_files.MESSAGES['not_git_repo']
 
 
-def test_get_git_root(git_repo: Path) -> None:
+def test_get_git_root(git_repo_ro: Path) -> None:
     """Test getting Git root directory."""
-    root = combine_files.get_git_root()
+    root = combine_files.get_git_root(git_repo_ro)
+    assert root is not None
+    assert root.resolve() == git_repo_ro.resolve()
+
+
+def test_get_git_root_cached(git_repo_ro: Path) -> None:
+    """Test that the Git root lookup runs only once per directory."""
+    combine_files.get_git_root(git_repo_ro)
+    with patch('combine_files.run_git_command') as mock_run:
+        root = combine_files.get_git_root(git_repo_ro)
+        mock_run.assert_not_called()
+    assert root is not None
+    assert root.resolve() == git_repo_ro.resolve()
+
+
+def test_get_git_root_explicit_cwd(git_repo_ro: Path, tmp_path: Path) -> None:
+    """Test looking up the Git root of a directory other than the current one."""
+    other = tmp_path / "other"
+    other.mkdir()
+
+    root = combine_files.get_git_root(git_repo_ro / "src")
     assert root is not None
-    assert root.resolve() == git_repo.resolve()
+    assert root.resolve() == git_repo_ro.resolve()
+    assert combine_files.get_git_root(other) is None
 
 
 def test_get_git_root_not_repo(tmp_path: Path) -> None:
     """Test error when not in a Git repository."""
-    os.chdir(tmp_path)
-    root = combine_files.get_git_root()
+    root = combine_files.get_git_root(tmp_path)
     assert root is None
 
 
-def test_get_tracked_paths_root(git_repo: Path) -> None:
+def test_get_tracked_paths_root(git_repo_ro: Path) -> None:
     """Test getting tracked paths from root directory."""
-    success, paths = combine_files.get_tracked_paths(git_repo)
+    success, paths = combine_files.get_tracked_paths(git_repo_ro)
     assert success
-    assert sorted(paths) == sorted(["README.md", "src", "tests"])
+    assert_same_items(paths, ["README.md", "src", "tests"])
 
 
-def test_get_tracked_paths_subdirectory(git_repo: Path) -> None:
+def test_get_tracked_paths_subdirectory(git_repo_ro: Path) -> None:
     """Test getting tracked paths from subdirectory."""
-    success, paths = combine_files.get_tracked_paths(git_repo / "src")
+    success, paths = combine_files.get_tracked_paths(git_repo_ro / "src")
     assert success
-    assert sorted(paths) == sorted(["main.py", "utils.py"])
+    assert_same_items(paths, ["main.py", "utils.py"])
 
 
-def test_get_tracked_paths_recursive(git_repo: Path) -> None:
+def test_get_tracked_paths_recursive(git_repo_ro: Path) -> None:
     """Test getting tracked paths recursively."""
-    success, paths = combine_files.get_tracked_paths(git_repo, recursive=True)
+    success, paths = combine_files.get_tracked_paths(git_repo_ro, recursive=True)
     assert success
     expected = [
         "README.md",
@@ -103,42 +199,370 @@ def test_get_tracked_paths_recursive(git_repo: Path) -> None:
         "src/utils.py",
         "tests/test_main.py"
     ]
-    assert sorted(paths) == sorted(expected)
+    assert_same_items(paths, expected)
+
+
+def test_get_tracked_paths_explicit_root(git_repo_ro: Path) -> None:
+    """Test that a known Git root skips the root lookup."""
+    with patch('combine_files.get_git_root') as mock_root:
+        success, paths = combine_files.get_tracked_paths(git_repo_ro / "src", git_root=git_repo_ro)
+        mock_root.assert_not_called()
+    assert success
+    assert_same_items(paths, ["main.py", "utils.py"])
+
+
+def test_get_tracked_paths_lists_repo_once(git_repo_ro: Path) -> None:
+    """Test that repeated lookups reuse a single git ls-files call."""
+    combine_files.get_tracked_paths(git_repo_ro)
+    with patch('combine_files.run_git_command') as mock_run:
+        success, paths = combine_files.get_tracked_paths(git_repo_ro / "src", recursive=True, git_root=git_repo_ro)
+        mock_run.assert_not_called()
+    assert success
+    assert_same_items(paths, ["src/main.py", "src/utils.py"])
+
 
+def test_get_tracked_paths_similar_prefixes(git_repo: Path) -> None:
+    """Test that only paths inside the directory match its prefix."""
+    for name in ["src-old/a.py", "src.txt", "src0/b.py", "src/sub/c.py"]:
+        (git_repo / name).parent.mkdir(exist_ok=True)
+        (git_repo / name).write_text("content")
+    git(git_repo, "add", ".")
+    combine_files.clear_caches()
 
-def test_partition_by_file_type(git_repo: Path) -> None:
+    success, paths = combine_files.get_tracked_paths(git_repo / "src", recursive=True)
+    assert success
+    assert paths == ["src/main.py", "src/sub/c.py", "src/utils.py"]
+
+    success, paths = combine_files.get_tracked_paths(git_repo / "src")
+    assert success
+    assert paths == ["main.py", "sub", "utils.py"]
+
+
+def test_clear_caches(git_repo: Path) -> None:
+    """Test that clearing the caches picks up newly tracked files."""
+    combine_files.get_tracked_paths(git_repo)
+    (git_repo / "new.txt").write_text("new")
+    git(git_repo, "add", "new.txt")
+
+    success, paths = combine_files.get_tracked_paths(git_repo)
+    assert success and "new.txt" not in paths
+
+    combine_files.clear_caches()
+    success, paths = combine_files.get_tracked_paths(git_repo)
+    assert success and "new.txt" in paths
+
+
+def test_get_tracked_paths_special_names(git_repo: Path) -> None:
+    """Test that non-ASCII and whitespace in file names are preserved."""
+    names = ["päivää.txt", "with space.txt", "tab\tname.txt"]
+    for name in names:
+        (git_repo / name).write_text("content")
+    git(git_repo, "add", ".")
+    git(git_repo, "commit", "-m", "Add special names")
+
+    success, paths = combine_files.get_tracked_paths(git_repo)
+    assert success
+    for name in names:
+        assert name in paths
+
+
+def test_list_tracked_files_with_pygit2(git_repo: Path) -> None:
+    """Test that the pygit2 index listing matches git ls-files."""
+    pytest.importorskip("pygit2")
+    (git_repo / "päivää.txt").write_text("content")
+    git(git_repo, "add", ".")
+
+    with patch('combine_files.pygit2', None):
+        combine_files._list_all_tracked_files.cache_clear()
+        expected = combine_files._list_all_tracked_files(git_repo)
+
+    combine_files._list_all_tracked_files.cache_clear()
+    with patch('combine_files.run_git_command') as mock_run:
+        assert combine_files._list_all_tracked_files(git_repo) == expected
+        mock_run.assert_not_called()
+
+
+def test_partition_by_file_type(git_repo_ro: Path) -> None:
     """Test separating paths into directories and files."""
     paths = ["src", "tests", "README.md"]
-    directories, files = combine_files.partition_by_file_type(paths, git_repo)
+    directories, files = combine_files.partition_by_file_type(paths, git_repo_ro)
     assert directories == ["src", "tests"]
     assert files == ["README.md"]
 
 
-def test_read_file_content(git_repo: Path) -> None:
+def test_partition_by_file_type_nested(git_repo_ro: Path) -> None:
+    """Test separating paths that are not direct children of the base directory."""
+    paths = ["src/main.py", "src", "missing"]
+    directories, files = combine_files.partition_by_file_type(paths, git_repo_ro)
+    assert directories == ["src"]
+    assert files == ["missing", "src/main.py"]
+
+
+def test_partition_by_file_type_from_listing(git_repo: Path) -> None:
+    """Test classifying tracked paths from the Git listing without filesystem checks."""
+    (git_repo / "src" / "sub").mkdir()
+    (git_repo / "src" / "sub" / "module.py").write_text("x = 1")
+    git(git_repo, "add", ".")
+    git(git_repo, "commit", "-m", "Add nested module")
+
+    with patch('os.scandir') as mock_scandir, patch('os.path.isdir') as mock_isdir:
+        directories, files = combine_files.partition_by_file_type(
+            ["main.py", "sub", "utils.py"], git_repo / "src", git_repo)
+        mock_scandir.assert_not_called()
+        mock_isdir.assert_not_called()
+
+    assert directories == ["sub"]
+    assert files == ["main.py", "utils.py"]
+
+
+def test_read_file_content(git_repo_ro: Path) -> None:
     """Test reading file content."""
-    success, content = combine_files.read_file_content(Path("README.md"), git_repo)
+    success, content = combine_files.read_file_content(Path("README.md"), git_repo_ro)
     assert success
     assert content == "# Test Project\nThis is a test project."
 
 
-def test_read_file_content_nonexistent(git_repo: Path) -> None:
+def test_read_file_content_nonexistent(git_repo_ro: Path) -> None:
     """Test reading nonexistent file."""
-    success, content = combine_files.read_file_content(Path("nonexistent.txt"), git_repo)
+    success, content = combine_files.read_file_content(Path("nonexistent.txt"), git_repo_ro)
     assert not success
     assert "File not found" in content
 
 
-def test_format_file_contents(git_repo: Path) -> None:
+def test_read_file_content_directory(git_repo_ro: Path) -> None:
+    """Test reading a directory as a file."""
+    success, content = combine_files.read_file_content(Path("src"), git_repo_ro)
+    assert not success
+    assert content == combine_files.MESSAGES['file_not_found'].format(Path("src"))
+
+
+def test_read_file_content_permission_denied(git_repo_ro: Path) -> None:
+    """Test that an unreadable file reports the read error, not a missing file."""
+    with patch('builtins.open', side_effect=PermissionError("Permission denied")):
+        success, content = combine_files.read_file_content(Path("README.md"), git_repo_ro)
+    assert not success
+    assert content == combine_files.MESSAGES['file_read_error'].format("Permission denied")
+
+
+def test_format_file_contents(git_repo_ro: Path) -> None:
     """Test formatting contents of multiple files."""
     file_paths = ["README.md", "src/main.py"]
-    success, output = combine_files.format_file_contents(file_paths, git_repo)
+    success, output = combine_files.format_file_contents(file_paths, git_repo_ro)
 
     assert success
-    assert "// BEGIN FILE: README.md" in output
+    sections = parse_sections(output)
+    assert list(sections) == file_paths
+    assert "# Test Project" in sections["README.md"]
+    assert "def main():" in sections["src/main.py"]
+
+
+def test_format_file_contents_layout(git_repo_ro: Path) -> None:
+    """Test the exact block layout of the formatted output."""
+    success, output = combine_files.format_file_contents(["README.md", "src/utils.py"], git_repo_ro)
+    nl = os.linesep
+
+    assert success
+    assert output == (
+        f"{nl}// BEGIN FILE: README.md{nl}# Test Project\nThis is a test project.{nl}// END FILE{nl}{nl}"
+        f"{nl}// BEGIN FILE: src/utils.py{nl}def helper():\n    return True{nl}// END FILE{nl}{nl}"
+    )
+
+
+def test_format_file_contents_missing_file(git_repo_ro: Path) -> None:
+    """Test that unreadable files are replaced by an error message."""
+    success, output = combine_files.format_file_contents(["missing.txt", "README.md"], git_repo_ro)
+
+    assert success
+    assert combine_files.MESSAGES['file_not_found'].format("missing.txt") in output
     assert "# Test Project" in output
-    assert "// BEGIN FILE: src/main.py" in output
-    assert "def main():" in output
-    assert "// END FILE" in output
+
+
+def test_write_file_contents_streams_bytes(git_repo: Path) -> None:
+    """Test that file bodies are copied to the output stream unchanged."""
+    (git_repo / "crlf.txt").write_bytes(b"first\r\nsecond\r\n")
+    out = io.BytesIO()
+
+    combine_files.write_file_contents(["crlf.txt"], git_repo, out)
+
+    assert b"// BEGIN FILE: crlf.txt" in out.getvalue()
+    assert b"first\r\nsecond\r\n" in out.getvalue()
+
+
+def test_write_file_contents_non_utf8_name(git_repo: Path) -> None:
+    """Test that file names which are not valid UTF-8 round-trip unchanged."""
+    name = os.fsdecode(b"caf\xe9.txt")
+    (git_repo / name).write_text("latin-1 name")
+    git(git_repo, "add", ".")
+
+    with patch('combine_files.pygit2', None):
+        success, paths = combine_files.get_tracked_paths(git_repo)
+    assert success
+    assert name in paths
+
+    out = io.BytesIO()
+    combine_files.write_file_contents([name], git_repo, out)
+    assert b"// BEGIN FILE: caf\xe9.txt" in out.getvalue()
+    assert b"latin-1 name" in out.getvalue()
+
+
+def test_write_file_contents_large_file(git_repo: Path) -> None:
+    """Test that files above the mmap threshold are copied in full."""
+    data = bytes(range(256)) * (combine_files.CONFIG['mmap_threshold'] // 256 + 1)
+    (git_repo / "large.bin").write_bytes(data)
+    out = io.BytesIO()
+
+    combine_files.write_file_contents(["large.bin"], git_repo, out)
+
+    assert data in out.getvalue()
+
+
+def test_write_file_contents_preserves_order(git_repo: Path) -> None:
+    """Test that read-ahead keeps the output in the requested order."""
+    names = [f"file{i:02}.txt" for i in range(combine_files.CONFIG['read_ahead'] * 2 + 1)]
+    for name in names:
+        (git_repo / name).write_text(f"content of {name}")
+    out = io.BytesIO()
+
+    combine_files.write_file_contents(list(reversed(names)), git_repo, out)
+
+    output = out.getvalue().decode()
+    positions = [output.index(f"// BEGIN FILE: {name}\ncontent of {name}") for name in reversed(names)]
+    assert positions == sorted(positions)
+
+
+@pytest.mark.parametrize("batch_threshold", [0, 100])
+def test_write_file_contents_closes_bodies_on_write_error(git_repo: Path, batch_threshold: int) -> None:
+    """Test that loaded bodies are released when writing fails, with and without the pool."""
+    names = [f"big{i:02}.txt" for i in range(12)]
+    for name in names:
+        (git_repo / name).write_bytes(b"x" * combine_files.CONFIG['mmap_threshold'])
+    read_file_body = combine_files.read_file_body
+    bodies = []
+
+    def load(file_path: str, git_root: Path) -> combine_files.FileBody:
+        bodies.append(read_file_body(file_path, git_root))
+        return bodies[-1]
+
+    class FailingWriter(io.BytesIO):
+        def write(self, data: Any) -> int:
+            if self.tell() > 0:
+                raise BrokenPipeError
+            return super().write(data)
+
+    with patch('combine_files.read_file_body', side_effect=load), \
+            patch.dict(combine_files.CONFIG, batch_threshold=batch_threshold):
+        with pytest.raises(BrokenPipeError):
+            combine_files.write_file_contents(names, git_repo, FailingWriter())
+
+    assert bodies
+    assert all(body.closed for body in bodies)
+
+
+def test_write_file_contents_jobs(git_repo_ro: Path) -> None:
+    """Test that the output does not depend on the number of reader threads."""
+    file_paths = ["README.md", "src/main.py", "src/utils.py", "tests/test_main.py"]
+    outputs = []
+    for jobs in (1, 3, 100):
+        out = io.BytesIO()
+        with patch.dict(combine_files.CONFIG, batch_threshold=0):
+            combine_files.write_file_contents(file_paths, git_repo_ro, out, jobs=jobs)
+        outputs.append(out.getvalue())
+
+    out = io.BytesIO()
+    combine_files.write_file_contents(file_paths, git_repo_ro, out)
+    outputs.append(out.getvalue())
+
+    assert outputs[0] == outputs[1] == outputs[2] == outputs[3]
+
+
+def test_write_file_contents_small_batch_without_pool(git_repo_ro: Path) -> None:
+    """Test that a handful of files is read without starting reader threads."""
+    out = io.BytesIO()
+    with patch('combine_files.concurrent.futures.ThreadPoolExecutor') as mock_pool:
+        combine_files.write_file_contents(["README.md", "src/main.py"], git_repo_ro, out)
+        mock_pool.assert_not_called()
+
+    assert out.getvalue().index(b"README.md") < out.getvalue().index(b"src/main.py")
+    assert b"def main():" in out.getvalue()
+
+
+def test_env_int(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test reading integer settings from the environment."""
+    monkeypatch.setenv("COMBINE_FILES_TEST_INT", "32")
+    assert combine_files._env_int("COMBINE_FILES_TEST_INT", 8) == 32
+    monkeypatch.setenv("COMBINE_FILES_TEST_INT", "lots")
+    assert combine_files._env_int("COMBINE_FILES_TEST_INT", 8) == 8
+    monkeypatch.delenv("COMBINE_FILES_TEST_INT")
+    assert combine_files._env_int("COMBINE_FILES_TEST_INT", 8) == 8
+
+
+def test_write_file_contents_skips_binary_and_large(git_repo: Path) -> None:
+    """Test that binary and oversized files are replaced by a placeholder."""
+    (git_repo / "image.PNG").write_bytes(b"\x89PNG\r\n")
+    (git_repo / "huge.txt").write_bytes(b"x" * (combine_files.CONFIG['max_file_size'] + 1))
+    out = io.BytesIO()
+
+    combine_files.write_file_contents(["image.PNG", "huge.txt"], git_repo, out)
+
+    output = out.getvalue().decode()
+    assert combine_files.MESSAGES['binary_file_skipped'] in output
+    assert combine_files.MESSAGES['large_file_skipped'].format(combine_files.CONFIG['max_file_size']) in output
+    assert "\x89PNG" not in output
+    assert "xxx" not in output
+
+
+def test_git_cat_file_reads_index(git_repo: Path) -> None:
+    """Test reading staged file contents through git cat-file."""
+    (git_repo / "README.md").write_text("unstaged edit")
+    (git_repo / "big.txt").write_bytes(b"y" * (combine_files.CONFIG['max_file_size'] + 1))
+    git(git_repo, "add", "big.txt")
+
+    with combine_files.GitCatFile(git_repo) as cat_file:
+        assert cat_file.read_body("README.md") == b"# Test Project\nThis is a test project."
+        assert cat_file.read_body("missing.txt") == combine_files.MESSAGES['file_not_found'].format("missing.txt").encode()
+        assert cat_file.read_body("big.txt") == combine_files.MESSAGES['large_file_skipped'].format(
+            combine_files.CONFIG['max_file_size']).encode()
+        assert cat_file.read_body("src/main.py") == b"def main():\n    print('Hello, World!')"
+
+
+def test_get_cat_file_shared(git_repo_ro: Path) -> None:
+    """Test that one cat-file process is shared per repository."""
+    try:
+        cat_file = combine_files.get_cat_file(git_repo_ro)
+        assert combine_files.get_cat_file(git_repo_ro) is cat_file
+        assert cat_file.read_body("README.md") == b"# Test Project\nThis is a test project."
+    finally:
+        combine_files.close_cat_files()
+
+    assert combine_files.get_cat_file(git_repo_ro) is not cat_file
+    combine_files.close_cat_files()
+
+
+def test_clear_caches_restarts_cat_file(git_repo: Path) -> None:
+    """Test that the shared cat-file process sees a restaged file after clear_caches()."""
+    try:
+        assert combine_files.get_cat_file(git_repo).read_body("README.md") == b"# Test Project\nThis is a test project."
+
+        (git_repo / "README.md").write_text("restaged")
+        git(git_repo, "add", "README.md")
+        combine_files.clear_caches()
+
+        assert combine_files.get_cat_file(git_repo).read_body("README.md") == b"restaged"
+    finally:
+        combine_files.close_cat_files()
+
+
+def test_write_file_contents_from_index(git_repo_ro: Path) -> None:
+    """Test that index output matches working tree output for unchanged files."""
+    file_paths = ["README.md", "src/main.py", "tests/test_main.py"]
+    from_tree = io.BytesIO()
+    from_index = io.BytesIO()
+
+    combine_files.write_file_contents(file_paths, git_repo_ro, from_tree)
+    with combine_files.GitCatFile(git_repo_ro) as cat_file:
+        combine_files.write_file_contents(file_paths, git_repo_ro, from_index, cat_file)
+
+    assert from_index.getvalue() == from_tree.getvalue()
 
 
 def test_parse_selection_valid() -> None:
@@ -148,84 +572,180 @@ def test_parse_selection_valid() -> None:
     assert result == [0, 1, 2]
 
 
-def test_parse_selection_invalid() -> None:
+def test_parse_selection_int_forms() -> None:
+    """Test that selections accept every form int() accepts."""
+    assert combine_files.parse_selection("+3, 1_0", 10) == (True, [2, 9])
+
+
+def test_parse_selection_separators() -> None:
+    """Test that spaces, commas and semicolons all separate numbers."""
+    success, result = combine_files.parse_selection(" 1;2 , 3\t4,,5 ", 5)
+    assert success
+    assert result == [0, 1, 2, 3, 4]
+
+
+def test_try_parse_number() -> None:
+    """Test parsing numbers within a range."""
+    assert combine_files.try_parse_number("3", 1, 5) == (True, 3)
+    assert combine_files.try_parse_number("-2", -5, 5) == (True, -2)
+    assert combine_files.try_parse_number("--2", -5, 5) == (False, 0)
+    assert combine_files.try_parse_number("²", 0, 5) == (False, 0)
+    assert combine_files.try_parse_number("", 0, 5) == (False, 0)
+    assert combine_files.try_parse_number("+3", 0, 5) == (True, 3)
+    assert combine_files.try_parse_number("1_0", 0, 20) == (True, 10)
+
+
+@pytest.mark.parametrize("input_str,expected", [
+    ("", (False, combine_files.MESSAGES['empty_input'])),
+    ("0", (False, combine_files.MESSAGES['invalid_number'].format("0"))),
+    ("6", (False, combine_files.MESSAGES['invalid_number'].format("6"))),
+    ("abc", (False, combine_files.MESSAGES['invalid_number'].format("abc"))),
+    ("1,abc,3", (False, combine_files.MESSAGES['invalid_number'].format("abc"))),
+    ("1 2 999", (False, combine_files.MESSAGES['invalid_number'].format("999"))),
+    ("2,-1", (False, combine_files.MESSAGES['invalid_number'].format("-1"))),
+    ("1_0", (False, combine_files.MESSAGES['invalid_number'].format("1_0"))),
+    ("+6", (False, combine_files.MESSAGES['invalid_number'].format("+6"))),
+])
+def test_parse_selection_invalid(input_str: str, expected: Tuple[bool, str]) -> None:
     """Test parsing invalid selection input."""
-    test_cases = [
-        ("", (False, combine_files.MESSAGES['empty_input'])),
-        ("0", (False, combine_files.MESSAGES['invalid_number'].format("0"))),
-        ("6", (False, combine_files.MESSAGES['invalid_number'].format("6"))),
-        ("abc", (False, combine_files.MESSAGES['invalid_number'].format("abc"))),
-    ]
+    assert combine_files.parse_selection(input_str, 5) == expected
 
-    for input_str, expected in test_cases:
-        success, result = combine_files.parse_selection(input_str, 5)
-        assert (success, result) == expected
 
+def test_format_item_listing() -> None:
+    """Test formatting the numbered item listing."""
+    listing = combine_files.format_item_listing(["src", "README.md"], ["src"])
+    assert listing == f"1. (DIR) src{os.linesep}2. README.md"
 
-def test_collect_all_files(git_repo: Path) -> None:
+
+def test_collect_all_files(git_repo_ro: Path) -> None:
     """Test collecting all file paths from selected items."""
     selected_paths = ["src", "README.md"]
-    files = combine_files.collect_all_files(selected_paths, git_repo, git_repo)
-    assert sorted(files) == sorted(["README.md", "src/main.py", "src/utils.py"])
+    files = combine_files.collect_all_files(selected_paths, git_repo_ro, git_repo_ro)
+    assert_same_items(files, ["README.md", "src/main.py", "src/utils.py"])
+
+
+def test_collect_all_files_subdirectory_target(git_repo_ro: Path) -> None:
+    """Test collecting files when the target directory is not the Git root."""
+    files = combine_files.collect_all_files(["main.py"], git_repo_ro / "src", git_repo_ro)
+    assert files == ["src/main.py"]
+
+    files = combine_files.collect_all_files(["src", "tests"], git_repo_ro, git_repo_ro)
+    assert files == ["src/main.py", "src/utils.py", "tests/test_main.py"]
+
 
+def test_collect_all_files_symlinked_target(git_repo_ro: Path, tmp_path: Path) -> None:
+    """Test collecting files when the target directory is reached through a symlink."""
+    link = tmp_path / "link"
+    link.symlink_to(git_repo_ro)
 
-def test_write_output(tmp_path: Path) -> None:
+    with patch('os.path.realpath', wraps=os.path.realpath) as mock_realpath:
+        files = combine_files.collect_all_files(["src", "README.md"], link, git_repo_ro)
+        assert mock_realpath.call_count == 2
+
+    assert files == ["README.md", "src/main.py", "src/utils.py"]
+
+
+def test_collect_all_files_single_git_call(git_repo_ro: Path) -> None:
+    """Test that expanding several directories runs git ls-files only once."""
+    combine_files._list_all_tracked_files.cache_clear()
+    with patch('combine_files.pygit2', None), \
+            patch('combine_files.run_git_command', wraps=combine_files.run_git_command) as mock_run:
+        files = combine_files.collect_all_files(["src", "tests", "README.md"], git_repo_ro, git_repo_ro)
+        assert mock_run.call_count == 1
+    assert files == ["README.md", "src/main.py", "src/utils.py", "tests/test_main.py"]
+
+
+def test_collect_all_files_overlapping_selection(git_repo_ro: Path) -> None:
+    """Test that files selected more than once are collected only once."""
+    files = combine_files.collect_all_files(["src", "src/main.py", ".", "README.md"], git_repo_ro, git_repo_ro)
+    assert files == ["README.md", "src/main.py", "src/utils.py", "tests/test_main.py"]
+
+
+def test_write_output(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
     """Test writing output to file and stdout."""
     test_content = "Test content"
     output_file = tmp_path / "output.txt"
 
     # Test stdout
-    with patch('builtins.print') as mock_print:
-        combine_files.write_output(test_content)
-        mock_print.assert_called_once_with(test_content)
+    combine_files.write_output(test_content)
+    assert capsys.readouterr().out == test_content
 
     # Test file output
     combine_files.write_output(test_content, str(output_file))
-    assert output_file.read_text() == test_content
+    assert output_file.read_bytes() == test_content.encode()
 
 
 @pytest.mark.parametrize("args,expected_exit_code", [
     (["-h"], 0),
     (["nonexistent_directory"], 1),
     (["-o", "output.txt", "-p", "nonexistent_directory"], 1),
+    (["-j", "0"], 2),
+    (["--jobs", "many"], 2),
 ])
-def test_main_error_cases(args: List[str], expected_exit_code: int) -> None:
+def test_main_error_cases(args: List[str], expected_exit_code: int, monkeypatch: pytest.MonkeyPatch) -> None:
     """Test various error cases in main function."""
-    with patch('sys.argv', ['combine_files.py'] + args):
-        with pytest.raises(SystemExit) as exc_info:
-            combine_files.main()
-        assert exc_info.value.code == expected_exit_code
+    monkeypatch.setattr(sys, "argv", ['combine_files.py'] + args)
+    with pytest.raises(SystemExit) as exc_info:
+        combine_files.main()
+    assert exc_info.value.code == expected_exit_code
 
 
-@patch('builtins.input')
-def test_interactive_mode(mock_input: MagicMock, git_repo: Path) -> None:
+def test_interactive_mode(git_repo_ro: Path, capsys: pytest.CaptureFixture[str], monkeypatch: pytest.MonkeyPatch) -> None:
     """Test interactive mode with user input."""
-    mock_input.return_value = "3"  # Select README.md
+    monkeypatch.setattr("builtins.input", lambda *args, **kwargs: "3")  # Select README.md
+    monkeypatch.setattr(sys, "argv", ['combine_files.py', str(git_repo_ro)])
+
+    combine_files.main()
+
+    output = capsys.readouterr().out
+    output = output.replace('\r\n', '\n')  # Normalize line endings
+
+    assert "Git-tracked items in directory:" in output
+    assert "// BEGIN FILE: README.md" in output
+    assert "# Test Project" in output
 
-    with patch('sys.argv', ['combine_files.py']):
-        with patch('sys.stdout') as mock_stdout:
-            combine_files.main()
 
-            output = ''.join(call.args[0] for call in mock_stdout.write.call_args_list)
-            output = output.replace('\r\n', '\n')  # Normalize line endings
+def test_interactive_mode_non_utf8_name(git_repo: Path, capsysbinary: pytest.CaptureFixture[bytes],
+                                       monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test listing and selecting a file whose name is not valid UTF-8."""
+    (git_repo / os.fsdecode(b"caf\xe9.txt")).write_text("latin-1 name")
+    git(git_repo, "add", ".")
+    # src, tests, README.md, caf\xe9.txt
+    monkeypatch.setattr("builtins.input", lambda *args, **kwargs: "4")
+    monkeypatch.setattr(sys, "argv", ['combine_files.py', str(git_repo)])
 
-            assert "Git-tracked items in directory:" in output
-            assert "// BEGIN FILE: README.md" in output
-            assert "# Test Project" in output
+    combine_files.main()
 
+    output = capsysbinary.readouterr().out
+    assert b"4. caf\xe9.txt" in output
+    assert b"// BEGIN FILE: caf\xe9.txt" in output
+    assert b"latin-1 name" in output
 
-def test_noninteractive_mode(git_repo: Path) -> None:
+
+def test_noninteractive_mode(git_repo: Path, monkeypatch: pytest.MonkeyPatch) -> None:
     """Test non-interactive mode with -p flag."""
     output_file = git_repo / "output.txt"
+    monkeypatch.setattr(sys, "argv", ['combine_files.py', '-p', '-o', str(output_file), str(git_repo)])
 
-    with patch('sys.argv', ['combine_files.py', '-p', '-o', str(output_file)]):
-        combine_files.main()
+    combine_files.main()
 
-        assert output_file.exists()
-        content = output_file.read_text()
-        assert "// BEGIN FILE:" in content
-        assert "// END FILE" in content
-        assert "# Test Project" in content
+    assert output_file.exists()
+    content = output_file.read_bytes()
+    assert b"// BEGIN FILE:" in content
+    assert b"// END FILE" in content
+    assert b"# Test Project" in content
+
+
+def test_noninteractive_mode_matches_format(git_repo_ro: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the streamed output file matches format_file_contents."""
+    output_file = tmp_path / "combined.txt"
+    monkeypatch.setattr(sys, "argv", ['combine_files.py', '-p', '-o', str(output_file), str(git_repo_ro)])
+
+    combine_files.main()
+
+    expected_files = ["README.md", "src/main.py", "src/utils.py", "tests/test_main.py"]
+    _, expected = combine_files.format_file_contents(expected_files, git_repo_ro)
+    assert output_file.read_bytes() == expected.encode()
 
 
 def test_collect_all_files_dotted_dirs(git_repo: Path) -> None:
@@ -244,9 +764,8 @@ def test_collect_all_files_dotted_dirs(git_repo: Path) -> None:
     # Add regular top-level file
     (git_repo / "README.md").write_text("readme content")
 
-    # Add and commit all files
-    subprocess.run(["git", "add", "."], cwd=git_repo)
-    subprocess.run(["git", "commit", "-m", "Add test files"], cwd=git_repo)
+    # Stage all files; tracked paths come from the index, so no commit is needed
+    git(git_repo, "add", ".")
 
     # Verify git tracking works correctly first
     success, paths = combine_files.get_tracked_paths(git_repo)
@@ -265,9 +784,6 @@ def test_collect_all_files_dotted_dirs(git_repo: Path) -> None:
     }
     actual_paths = set(collected)
 
-    print(f"\nExpected paths: {sorted(expected_paths)}")
-    print(f"Actual paths: {sorted(actual_paths)}")
-
     # Test that all expected files are present
     assert actual_paths == expected_paths, \
         "Not all files from Language.Tests directory were collected"
\ No newline at end of file